@@ -1,15 +1,30 @@
-﻿from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+﻿from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator
+from typing import Any, Dict, List, Optional
 from gdpr_gateway import core
-from gdpr_gateway.core.processing import process_text
+from gdpr_gateway.core import audit_log, embeddings, spacy_worker
+from gdpr_gateway.core.processing import classify_text, process_text
+
+
+# Start the background workers before serving, drain them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    embeddings.warm_up()
+    spacy_worker.start()
+    audit_log.start()
+    yield
+    await spacy_worker.stop()
+    await audit_log.stop()
+
 
 app = FastAPI(
     title="GDPR Gateway API",
     description="API for GDPR Layer between clients and chat applications",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -22,39 +37,48 @@ app.add_middleware(
 
 
 @app.get('/health', tags=["Health Check"])
-async def health_check():
-    return JSONResponse(content={"status": "ok"}, status_code=200)
+async def health_check() -> Dict[str, str]:
+    return {"status": "ok"}
 
 
 class ClassifyRequest(BaseModel):
     text: Optional[str] = None
 
+    @field_validator("text")
+    @classmethod
+    def replace_lone_surrogates(cls, text: Optional[str]) -> Optional[str]:
+        # A JSON "\ud800" escape decodes to a lone surrogate, which can't
+        # be written back out as UTF-8; replace them with U+FFFD
+        if text is None or text.isascii():
+            return text
+        return text.encode("utf-16-le", "surrogatepass").decode("utf-16-le", "replace")
+
 
 
 
 @app.post("/process_prompt")
-async def process_prompt(req: ClassifyRequest):
+async def process_prompt(req: ClassifyRequest) -> Dict[str, Any]:
     if not req.text:
         raise HTTPException(status_code=400, detail="Missing 'text'")
 
-    return process_text(req.text)
+    return await process_text(req.text)
 
 @app.post('/classify')
-async def classify(req: ClassifyRequest):
+async def classify(req: ClassifyRequest) -> Dict[str, Any]:
     """Classify text using the combined regex + NER classifier."""
     if not req.text:
         raise HTTPException(status_code=400, detail="Missing 'text' in request body")
 
     try:
-        result = core.classifier.classify_text(req.text)
+        result = await classify_text(req.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return JSONResponse(content=result)
+    return result
 
 
 @app.post('/detect_regex', tags=["Classifier"])
-async def detect_regex(req: ClassifyRequest):
+async def detect_regex(req: ClassifyRequest) -> Dict[str, List[str]]:
     """Return only regex-based PII detections."""
     if not req.text:
         raise HTTPException(status_code=400, detail="Missing 'text' in request body")
@@ -64,5 +88,5 @@ async def detect_regex(req: ClassifyRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return JSONResponse(content=result)
+    return result
 
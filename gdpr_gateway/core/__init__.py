@@ -1 +1 @@
-__all__ = ['classifier', 'special_classifier', 'embeddings', 'rag_classifier', 'gdpr_loader', 'processing']
\ No newline at end of file
+__all__ = ['classifier', 'special_classifier', 'embeddings', 'rag_classifier', 'gdpr_loader', 'processing', 'spacy_worker', 'audit_log', 'nlp_singleton']
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import glob
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+import msgpack
+
+"""Append-only audit log, written off the request path.
+
+Request handlers queue entries; a background writer batches them and
+appends each batch with a single write to the current segment file.
+Entries are on disk at most FLUSH_INTERVAL_S after they are queued.
+
+Entries are stored as a stream of MessagePack maps in size-rotated
+segments (audit_log.<epoch ns>.<pid>.msgpack); use read_audit_log() to
+iterate over them.
+"""
+
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# AUDIT LOG CONFIG
+# ==========================================================
+LOG_DIR = os.getenv("GDPR_AUDIT_DIR", "./logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+FLUSH_BYTES = 64 * 1024
+FLUSH_INTERVAL_S = 0.05
+
+_queue = None
+_writer_task = None
+_fd = None
+_segment_size = 0
+
+
+# ==========================================================
+# SEGMENTS
+# ==========================================================
+def _open_segment():
+    """Start a new segment; the pid keeps concurrent workers apart."""
+    global _fd, _segment_size
+
+    if _fd is not None:
+        os.close(_fd)
+
+    path = os.path.join(LOG_DIR, f"audit_log.{time.time_ns()}.{os.getpid()}.msgpack")
+    _fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    _segment_size = os.fstat(_fd).st_size
+
+
+# ==========================================================
+# WRITER LIFECYCLE
+# ==========================================================
+def start():
+    """Open a segment and start the writer on the running event loop (idempotent)."""
+    global _queue, _writer_task
+
+    if _writer_task is not None:
+        if not _writer_task.done():
+            return
+        if not _writer_task.cancelled() and _writer_task.exception() is not None:
+            logger.error("Audit log writer stopped; restarting", exc_info=_writer_task.exception())
+
+    if _fd is None:
+        _open_segment()
+    # Keep an existing queue: entries still waiting in it must be written
+    if _queue is None:
+        _queue = asyncio.Queue()
+    _writer_task = asyncio.get_running_loop().create_task(_writer())
+
+
+async def stop():
+    """Stop the writer, flush anything still queued and close the segment."""
+    global _queue, _writer_task, _fd
+
+    if _writer_task is not None:
+        _writer_task.cancel()
+        try:
+            await _writer_task
+        except asyncio.CancelledError:
+            pass
+        _writer_task = None
+
+    if _fd is not None:
+        buf = bytearray()
+        while _queue is not None and not _queue.empty():
+            buf += _encode_or_skip(_queue.get_nowait())
+        _write_all(buf)
+        os.close(_fd)
+        _fd = None
+
+    # Drained above; a later start() may run on a different event loop
+    _queue = None
+
+
+async def _writer():
+    buf = bytearray()
+    try:
+        while True:
+            buf += _encode_or_skip(await _queue.get())
+
+            # Keep batching until the buffer is full or the queue stays idle
+            while len(buf) < FLUSH_BYTES:
+                if _queue.empty():
+                    await asyncio.sleep(FLUSH_INTERVAL_S)
+                    if _queue.empty():
+                        break
+                buf += _encode_or_skip(_queue.get_nowait())
+
+            _write_all(buf)
+            buf.clear()
+    finally:
+        # Don't drop a batch that was in flight when the writer stopped
+        _write_all(buf)
+
+
+# ==========================================================
+# SERIALIZATION
+# ==========================================================
+def _encode(entry: Dict) -> bytes:
+    # The timestamp is queued as epoch nanoseconds and formatted only here
+    timestamp = datetime.fromtimestamp(entry["timestamp"] / 1e9, tz=timezone.utc)
+    return msgpack.packb({**entry, "timestamp": timestamp.isoformat()}, use_bin_type=True)
+
+
+def _encode_or_skip(entry: Dict) -> bytes:
+    """Encode an entry; one bad entry is logged and skipped, not fatal to the writer."""
+    try:
+        return _encode(entry)
+    except Exception:
+        logger.exception("Dropping unencodable audit log entry")
+        return b""
+
+
+def _write_all(buf: bytearray):
+    global _segment_size
+
+    if not buf:
+        return
+    if _segment_size >= SEGMENT_MAX_BYTES:
+        _open_segment()
+
+    view = memoryview(buf)
+    while view:
+        view = view[os.write(_fd, view):]
+    _segment_size += len(buf)
+
+
+# ==========================================================
+# PUBLIC API
+# ==========================================================
+def write(entry: Dict):
+    """Queue an audit entry; `entry["timestamp"]` is epoch nanoseconds."""
+    start()
+    _queue.put_nowait(entry)
+
+
+def read_audit_log(log_dir: Optional[str] = None) -> Iterator[Dict]:
+    """Stream every audit entry, oldest segment first, for compliance queries."""
+    pattern = os.path.join(log_dir or LOG_DIR, "audit_log.*.msgpack")
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "rb") as f:
+            yield from msgpack.Unpacker(f, raw=False)
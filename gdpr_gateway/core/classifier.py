@@ -1,21 +1,25 @@
-import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
 
 """Classifier module for detecting PII data using regex and spaCy NER."""
-# Optional spaCy import + guarded model load so app won't crash at import time
-try:
-    import spacy
-    try:
-        nlp = spacy.load("en_core_web_sm")
-        SPACY_ENABLED = True
-    except Exception:
-        nlp = None
-        SPACY_ENABLED = False
-except Exception:
-    spacy = None
-    nlp = None
-    SPACY_ENABLED = False
+from gdpr_gateway.core.nlp_singleton import NON_NER_PIPES, SPACY_ENABLED, nlp
 
 """Regular expressions for detecting various types of PII data."""
+# RE2 (pyre2) guarantees linear-time matching on adversarial input; the
+# stdlib engine is used when it isn't installed. Patterns therefore stick
+# to the common subset (flags inline as (?i:...)), except for the phone
+# lookarounds, which RE2 lacks and detect_pii_regex emulates.
+# Results match between the engines on ASCII text only: RE2's \d, \w and
+# \b are ASCII, the stdlib's are Unicode, so e.g. ".aé192.168.0.11" is a
+# phone "192.168" under re but an IPv4 address under RE2.
+try:
+    import re2 as re
+    RE2_ENABLED = True
+except ImportError:
+    import re
+    RE2_ENABLED = False
+
 # ===========================
 # Email Pattern
 # ===========================
@@ -37,31 +41,32 @@ EMAIL_RE = re.compile(
 #   (415) 555-2671
 #   415-555-2671
 #   415 555 2671
+#   +49 89 636 48018
+#   +31 20 794 60958
+#   +1 (415) 555-26710
+#   0800 123 45678
+#   06-12-34-56-78 (wins over the date-like "06-12-34" prefix)
 #
 # Characteristics:
 #   - Optional leading +
 #   - Allows spaces, dashes, parentheses
 #   - Requires 7–15 total digits (E.164 compatible)
-#   - Avoids matching long IDs or timestamps
+#   - Avoids matching long IDs or timestamps: no digit directly before
+#     or after (lookarounds under re, emulated in detect_pii_regex
+#     under RE2)
 #
 # Not supported:
 #   - Extensions (x123)
 #   - Shortcodes (911, 112)
 #   - Alphanumeric vanity numbers
 # ===========================
+_PHONE_SOURCE = (
+    r"\+?\d{1,3}[\s\-\.]?"               # optional country code
+    r"(?:\(\d{1,4}\)|\d{1,4})?"          # optional area code
+    r"(?:[\s\-\.]?\d{2,4}){2,4}"         # number groups
+)
 PHONE_RE = re.compile(
-    r"""
-    (?<!\d)                              # no digit before
-
-    (                                   # full phone number
-        \+?\d{1,3}[\s\-\.]?              # optional country code
-        (?:\(\d{1,4}\)|\d{1,4})?         # optional area code
-        (?:[\s\-\.]?\d{2,4}){2,4}        # number groups
-    )
-
-    (?!\d)                              # no digit after
-    """,
-    re.VERBOSE
+    _PHONE_SOURCE if RE2_ENABLED else rf"(?<!\d)(?:{_PHONE_SOURCE})(?!\d)"
 )
 
 
@@ -70,11 +75,29 @@ PHONE_RE = re.compile(
 # ===========================
 # Credit Card Patterns
 # Visa, MasterCard, Amex generic
+#
+# 13–19 digits with at most one space/dash between them. Each step
+# must consume a digit, so matching stays linear on long digit runs.
+# Candidates are confirmed with a Luhn checksum in detect_pii_regex.
 # ===========================
 CREDIT_CARD_RE = re.compile(
-    r"\b(?:\d[ -]*?){13,19}\b"
+    r"\b(?:\d[- ]?){12,18}\d\b"
 )
 
+_CC_SEPARATORS = str.maketrans("", "", "- ")
+
+
+def _luhn_valid(number: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(number.translate(_CC_SEPARATORS))):
+        digit = int(ch)
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
 # ===========================
 # IBAN (Basic validation)
 # Starts with country code + 2 digits
@@ -91,25 +114,23 @@ IPV4_RE = re.compile(
 )
 
 IPV6_RE = re.compile(
-    r"\b(?:[A-F0-9]{1,4}:){7}[A-F0-9]{1,4}\b",
-    re.IGNORECASE
+    r"\b(?i:(?:[A-F0-9]{1,4}:){7}[A-F0-9]{1,4})\b"
 )
 
 # ===========================
 # URL / Website detection
 # ===========================
 URL_RE = re.compile(
-    r"\bhttps?://[^\s/$.?#].[^\s]*\b", re.IGNORECASE
+    r"\b(?i:https?://[^\s/$.?#].[^\s]*)\b"
 )
 
 # ===========================
 # Dates — broad pattern
 # ===========================
 DATE_RE = re.compile(
-    r"\b(?:\d{1,2}[/-]\d{1,2}[/-]\d{2,4}"
+    r"\b(?i:\d{1,2}[/-]\d{1,2}[/-]\d{2,4}"
     r"|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4}"
-    r")\b",
-    re.IGNORECASE
+    r")\b"
 )
 
 # ===========================
@@ -120,44 +141,279 @@ DATE_RE = re.compile(
 #   ID-998877
 # ===========================
 GENERIC_ID_RE = re.compile(
-    r"\b(?:ID|CUST|USER|ACC)[-_]?\d{3,10}\b",
-    re.IGNORECASE
+    r"\b(?i:ID|CUST|USER|ACC)[-_]?\d{3,10}\b"
 )
 
+# ===========================
+# spaCy DATE false positives
+# Digit groups such as "20 7946 0958" are phone numbers, not dates
+# ===========================
+_DATE_PHONE_RE = re.compile(r"\d{2,} [\d\s]{2,}")
+
+
+# ==========================================================
+# COMBINED PATTERN
+#
+# All patterns are fused into one alternation of named groups so the
+# text is traversed once. At each position the first alternative that
+# matches wins, so structured patterns come before the loose
+# digit-group ones (credit card, then phone last).
+# ==========================================================
+PII_PATTERNS = {
+    "email": EMAIL_RE,
+    "url": URL_RE,
+    "iban": IBAN_RE,
+    "ipv6": IPV6_RE,
+    "ipv4": IPV4_RE,
+    "date": DATE_RE,
+    "customer_id": GENERIC_ID_RE,
+    "credit_card": CREDIT_CARD_RE,
+    "phone": PHONE_RE
+}
+_PII_ITEMS = tuple(PII_PATTERNS.items())
+
+
+def _combine(items):
+    return re.compile(
+        "|".join(f"(?P<{key}>{pattern.pattern})" for key, pattern in items)
+    )
+
+
+COMBINED_RE = _combine(_PII_ITEMS)
+
+
+@lru_cache(maxsize=None)
+def _combined_subset(ids):
+    """Alternation over only the patterns Hyperscan found in the text.
+
+    Dropping alternatives that match nowhere in the text cannot change
+    which alternative wins elsewhere, so the result equals COMBINED_RE's.
+    """
+    return _combine([_PII_ITEMS[i] for i in ids])
+
+
+# ==========================================================
+# HYPERSCAN PREFILTER (optional)
+#
+# One native block-mode sweep reports which patterns can match at
+# all, so the combined `re` pass below only tries those. The
+# Hyperscan database compiles the same sources in prefilter mode, so it
+# may over-report but never misses.
+# ==========================================================
+def _build_hs_database():
+    flags = (
+        hyperscan.HS_FLAG_UTF8
+        | hyperscan.HS_FLAG_UCP
+        | hyperscan.HS_FLAG_PREFILTER
+        | hyperscan.HS_FLAG_SINGLEMATCH
+    )
+
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[p.pattern.encode("utf-8") for _, p in _PII_ITEMS],
+        ids=list(range(len(_PII_ITEMS))),
+        elements=len(_PII_ITEMS),
+        flags=[flags] * len(_PII_ITEMS)
+    )
+    return db
+
+
+try:
+    import hyperscan
+    HS_DB = _build_hs_database()
+    HYPERSCAN_ENABLED = True
+except Exception:
+    hyperscan = None
+    HS_DB = None
+    HYPERSCAN_ENABLED = False
+
+
+# Hyperscan scratch space must not be shared by concurrent scans
+_hs_local = threading.local()
+
+
+def _hs_scratch():
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(HS_DB)
+    return scratch
+
+
+def _hs_candidates(text: str):
+    """Return the ids (indexes into _PII_ITEMS) of patterns present in text."""
+    hits = set()
+
+    def on_match(pattern_id, start, end, flags, context):
+        hits.add(pattern_id)
+
+    HS_DB.scan(text.encode("utf-8"), match_event_handler=on_match, scratch=_hs_scratch())
+    return tuple(sorted(hits))
+
 
 # ==========================================================
 # MAIN DETECTION FUNCTION
 # ==========================================================
 
+# Every pattern needs an ASCII digit, "@" (email) or ":" (URL, IPv6).
+# Non-ASCII text skips this gate since `\d` also matches other scripts'
+# digits under the stdlib engine.
+_TRIGGER_CHARS = frozenset("0123456789@:")
+
+
+# Longest possible phone match: "+", 3-digit country code, separator,
+# "(dddd)" area code and four separator + 4-digit groups
+_PHONE_MAX_CHARS = 31
+
+
+def _phone_end(text: str, start: int, end: int, endpos: int):
+    """
+    End of the phone number matched at text[start:end], or None.
+
+    Stands in for the (?<!\\d)/(?!\\d) lookarounds under RE2: a match
+    preceded by a digit is rejected, and one followed by a digit is
+    replaced by the longest match from the same start that isn't. Under
+    re the lookarounds already hold and the match is returned unchanged.
+    """
+    if start > 0 and text[start - 1].isdecimal():
+        return None
+    if end == endpos or not text[end].isdecimal():
+        return end
+
+    for cut in range(min(endpos, start + _PHONE_MAX_CHARS), start, -1):
+        if cut < endpos and text[cut].isdecimal():
+            continue
+        if text[cut - 1].isdecimal() and PHONE_RE.fullmatch(text, start, cut):
+            return cut
+    return None
+
+
+def _resume_after_phone(text: str, start: int) -> int:
+    """
+    Where to continue after rejecting the phone match at `start`.
+
+    Inside a digit run nothing can match: a phone can't start after a
+    digit and every other alternative starts with \\b. Skipping the run
+    keeps RE2 linear on long digit runs instead of restarting the search
+    at every digit. After a leading "+" the next position is retried.
+    """
+    pos = start + 1
+    if text[start].isdecimal():
+        while pos < len(text) and text[pos].isdecimal():
+            pos += 1
+    return pos
+
+
+def _find_phones(text: str, pos: int, endpos: int):
+    """Yield every phone number in text[pos:endpos]."""
+    while pos < endpos:
+        m = PHONE_RE.search(text, pos, endpos)
+        if m is None:
+            return
+        end = _phone_end(text, m.start(), m.end(), endpos)
+        if end is None:
+            pos = min(endpos, _resume_after_phone(text, m.start()))
+            continue
+        yield text[m.start():end]
+        pos = end
+
+
+def _longer_number_at(text: str, start: int, end: int):
+    """
+    A card or phone candidate starting where a date matched, if longer.
+
+    The alternation keeps the first alternative that matches, so
+    "06-12-34-56-78" would otherwise stop at the date "06-12-34" and
+    leave the rest of the phone number unmasked. A phone of the same
+    length is returned too; the caller reports the span as both.
+    """
+    m = CREDIT_CARD_RE.match(text, start)
+    if m and m.end() > end:
+        return "credit_card", m.end()
+
+    m = PHONE_RE.match(text, start)
+    if m:
+        phone_end = _phone_end(text, start, m.end(), len(text))
+        if phone_end is not None and phone_end >= end:
+            return "phone", phone_end
+
+    return "date", end
+
+
+# RE2 and Hyperscan take UTF-8, which can't encode lone surrogates
+# (e.g. from a JSON "\ud800" escape). No pattern matches one, so they
+# are swapped for U+FFFD, which keeps every offset and match unchanged.
+_SURROGATES = dict.fromkeys(range(0xD800, 0xE000), 0xFFFD)
+
+
+def _utf8_safe(text: str) -> str:
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return text.translate(_SURROGATES)
+    return text
+
+
 def detect_pii_regex(text: str):
-    pii = {}
-
-    patterns = {
-        "email": EMAIL_RE,
-        "phone": PHONE_RE,
-        "credit_card": CREDIT_CARD_RE,
-        "iban": IBAN_RE,
-        "ipv4": IPV4_RE,
-        "ipv6": IPV6_RE,
-        "url": URL_RE,
-        "date": DATE_RE,
-        "customer_id": GENERIC_ID_RE
-    }
+    # Plain prose can't match anything: skip the scan entirely
+    if text.isascii():
+        if _TRIGGER_CHARS.isdisjoint(text):
+            return {}
+    elif RE2_ENABLED or HYPERSCAN_ENABLED:
+        text = _utf8_safe(text)
+
+    if HYPERSCAN_ENABLED:
+        ids = _hs_candidates(text)
+        if not ids:
+            return {}
+        combined = _combined_subset(ids)
+    else:
+        combined = COMBINED_RE
+
+    pii = defaultdict(list)
+    pos = 0
+    while pos < len(text):
+        m = combined.search(text, pos)
+        if m is None:
+            break
+        key = m.lastgroup
+        start, end = m.span()
+        pos = end
+
+        if key == "date":
+            key, end = _longer_number_at(text, start, end)
+            pos = end
+            # Same span either way ("12-34-5678"): report both readings
+            if key == "phone" and end == m.end():
+                pii["date"].append(text[start:end])
+
+        if key == "phone":
+            end = _phone_end(text, start, end, len(text))
+            if end is None:
+                pos = _resume_after_phone(text, start)
+                continue
+            pos = end
+
+        # Digit runs failing Luhn are not cards, but may contain phones
+        elif key == "credit_card" and not _luhn_valid(text[start:end]):
+            phones = list(_find_phones(text, start, end))
+            if phones:
+                pii["phone"].extend(phones)
+            continue
 
-    for key, pattern in patterns.items():
-        matches = pattern.findall(text)
-        if matches:
-            pii[key] = matches
+        pii[key].append(text[start:end])
 
-    return pii
+    return {key: pii[key] for key in PII_PATTERNS if key in pii}
 
 
 def detect_pii_spacy(text: str):
     if not SPACY_ENABLED:
         return {}
 
-    doc = nlp(text)
+    return entities_from_doc(nlp(text, disable=NON_NER_PIPES))
 
+
+def entities_from_doc(doc):
+    """Filter and group the entities of an already-processed spaCy Doc."""
     entities = {
         "person": [],
         "org": [],
@@ -177,16 +433,13 @@ def detect_pii_spacy(text: str):
         if value.lower() in skip_words:
             continue
 
-        # Remove phone numbers misinterpreted as DATE
-        if label == "date" and re.search(r"\d{2,} [\d\s]{2,}", value):
-            continue
-
-        # Remove single numbers incorrectly labeled DATE
-        if label == "date" and value.isdigit():
-            continue
-
-        # Remove nonsense like "1111 1111"
-        if label == "date" and len(value.replace(" ", "")) <= 4:
+        # Remove DATE mislabels: single numbers, nonsense like "1111 1111"
+        # and phone numbers
+        if label == "date" and (
+            value.isdigit()
+            or len(value.replace(" ", "")) <= 4
+            or _DATE_PHONE_RE.search(value)
+        ):
             continue
 
         # --- 2. ADD CLEAN LABELS ---
@@ -211,23 +464,24 @@ def merge_person_names(names):
         return []
 
     merged = []
-    buffer = ""
+    buffer = []
 
     for name in names:
         # If the name ends with lowercase (e.g. 'van'),
         # it is likely part of a multi-word surname.
         if name.split()[-1].islower():
-            buffer = (buffer + " " + name).strip()
+            buffer.append(name)
         else:
             # Complete the buffer if building a surname
             if buffer:
-                merged.append((buffer + " " + name).strip())
-                buffer = ""
+                buffer.append(name)
+                merged.append(" ".join(buffer).strip())
+                buffer = []
             else:
                 merged.append(name)
 
     if buffer:
-        merged.append(buffer)
+        merged.append(" ".join(buffer).strip())
 
     return merged
 
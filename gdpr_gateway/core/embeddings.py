@@ -1,7 +1,71 @@
+import xxhash
+from cachetools import LRUCache
 from chromadb.utils import embedding_functions
 
+# Embed on the GPU when one is available
+try:
+    import torch
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+except ImportError:
+    DEVICE = "cpu"
+
+
+# Half precision on the GPU halves weight memory traffic
+MODEL_KWARGS = {"torch_dtype": "float16"} if DEVICE == "cuda" else {}
 
 # Load embedding model
 embedder = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="BAAI/bge-small-en-v1.5"
-)
\ No newline at end of file
+    model_name="BAAI/bge-small-en-v1.5",
+    device=DEVICE,
+    normalize_embeddings=True,
+    model_kwargs=MODEL_KWARGS
+)
+
+
+def warm_up():
+    """Run one dummy encode so weights and kernels are loaded before the first request."""
+    embedder(["warm up"])
+
+
+# HNSW index settings for the gdpr_chunks collection; Chroma only applies
+# them when the collection is created. The collection is small, so a
+# modest search_ef keeps recall while cutting graph traversal per query.
+# The space is cosine, which is what Chroma picks by default for this
+# embedding function and what the shipped gdpr_db was built with; the
+# distance threshold in gdpr_semantic_classifier is calibrated against
+# it (squared l2 would double every distance on normalized vectors).
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 32
+}
+
+
+# ==========================================================
+# QUERY EMBEDDING CACHE
+# Embedding a query costs far more than the HNSW search itself, so
+# repeated queries are served from an LRU keyed on a digest of the text
+# ==========================================================
+class CachedEmbedder:
+    def __init__(self, embed_fn, maxsize: int = 4096):
+        self.embed_fn = embed_fn
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def embed(self, text: str):
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts):
+        """Embed texts in input order; only cache misses reach the model, in one batch."""
+        keys = [xxhash.xxh3_128_intdigest(text.encode("utf-8", "surrogatepass")) for text in texts]
+        vecs = {key: self.cache.get(key) for key in keys}
+
+        misses = {key: text for key, text in zip(keys, texts) if vecs[key] is None}
+        if misses:
+            for key, vec in zip(misses, self.embed_fn(list(misses.values()))):
+                self.cache[key] = vecs[key] = vec
+
+        return [vecs[key] for key in keys]
+
+
+cached_embedder = CachedEmbedder(embedder)
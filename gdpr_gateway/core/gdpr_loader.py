@@ -1,13 +1,19 @@
 import chromadb
 import os
+from itertools import islice
 from chromadb.utils import embedding_functions
-from core import embeddings
+from gdpr_gateway.core import embeddings
+from gdpr_gateway.core.nlp_singleton import SPACY_ENABLED, nlp
 import re
 
 """Creates a ChromaDB database of GDPR text chunks for RAG classification
 with both structural metadata (Article/Recital) and semantic metadata (spaCy)."""
 
 
+# Chunks are enriched and inserted in batches to cap peak memory
+ADD_BATCH_SIZE = 512
+
+
 # ---------------------------------------------------------
 # PATH SETUP
 # ---------------------------------------------------------
@@ -24,16 +30,25 @@ RECITAL_RE = re.compile(r"(?m)^\s*Recital\s+(\d+)\b", re.IGNORECASE)
 
 
 # ---------------------------------------------------------
-# OPTIONAL spaCy LOADING
+# OPTIONAL spaCy (shared pipeline)
 # ---------------------------------------------------------
-try:
-    import spacy
-    nlp = spacy.load("en_core_web_sm")
-    SPACY_ENABLED = True
+LEGAL_TERMS = {
+    "controller", "processor", "data subject", "consent",
+    "legitimate interest", "profiling", "supervisory authority",
+    "personal data", "processing"
+}
+
+if SPACY_ENABLED:
+    from spacy.attrs import LEMMA
+
+    # Lemma hash ids of the legal terms, in the casings lemmas come in
+    _LEGAL_TERM_IDS = {
+        nlp.vocab.strings.add(variant)
+        for term in LEGAL_TERMS
+        for variant in (term, term.capitalize(), term.upper())
+    }
     print("spaCy loaded successfully.")
-except:
-    nlp = None
-    SPACY_ENABLED = False
+else:
     print("spaCy NOT available — semantic enrichment disabled.")
 
 
@@ -49,16 +64,17 @@ def load_gdpr_text():
 def chunk_text(text, chunk_size=250, overlap=50):
     """Split into overlapping word chunks."""
     words = text.split()
-    chunks = []
+    step = chunk_size - overlap
+    join = " ".join
+
+    return [join(words[start:start + chunk_size]) for start in range(0, len(words), step)]
 
-    start = 0
-    while start < len(words):
-        end = start + chunk_size
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        start = end - overlap
 
-    return chunks
+def batched(items, size):
+    """Yield successive lists of at most `size` items."""
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
 
 
 def extract_structural_metadata(chunk):
@@ -81,13 +97,8 @@ def extract_structural_metadata(chunk):
 
 def sanitize_metadata(metadata: dict):
     """ChromaDB does not allow None values, so replace them with valid defaults."""
-    clean = {}
-    for key, value in metadata.items():
-        if value is None:
-            clean[key] = ""  # empty string is allowed
-        else:
-            clean[key] = value
-    return clean
+    # empty string is allowed
+    return {key: "" if value is None else value for key, value in metadata.items()}
 
 
 
@@ -110,21 +121,18 @@ def extract_spacy_metadata(chunk):
 
     entities = [ent.text for ent in doc.ents]
 
-    LEGAL_TERMS = {
-        "controller", "processor", "data subject", "consent",
-        "legitimate interest", "profiling", "supervisory authority",
-        "personal data", "processing"
-    }
-
-    keywords = [
-        token.text for token in doc 
-        if token.lemma_.lower() in LEGAL_TERMS
-    ]
+    # Intersect the doc's lemma table with the legal-term ids in bulk
+    # instead of reading each token's lemma string
+    strings = doc.vocab.strings
+    keywords = sorted({
+        strings[lemma].lower() for lemma in doc.count_by(LEMMA)
+        if lemma in _LEGAL_TERM_IDS
+    })
 
     return {
         "entities": ", ".join(entities) if entities else None,
         "keywords": ", ".join(keywords) if keywords else None,
-        "sentence_count": len(list(doc.sents))
+        "sentence_count": sum(1 for _ in doc.sents)
     }
 
 
@@ -145,7 +153,8 @@ def build_gdpr_chroma_db():
 
     collection = client.get_or_create_collection(
         name="gdpr_chunks",
-        embedding_function=embeddings.embedder
+        embedding_function=embeddings.embedder,
+        metadata=embeddings.HNSW_METADATA
     )
 
     # Load + chunk
@@ -153,29 +162,30 @@ def build_gdpr_chroma_db():
     chunks = chunk_text(text)
     print(f"Loaded {len(chunks)} chunks.")
 
-    documents = []
-    metadatas = []
-    ids = []
+    for batch in batched(enumerate(chunks), ADD_BATCH_SIZE):
+        documents = []
+        metadatas = []
+        ids = []
 
-    for i, chunk in enumerate(chunks):
-        struct_meta = extract_structural_metadata(chunk)
-        spacy_meta = extract_spacy_metadata(chunk)
+        for i, chunk in batch:
+            struct_meta = extract_structural_metadata(chunk)
+            spacy_meta = extract_spacy_metadata(chunk)
 
-        documents.append(chunk)
+            documents.append(chunk)
 
-        metadata = {**struct_meta, **spacy_meta}
-        metadata = sanitize_metadata(metadata)
-        metadatas.append(metadata)
+            metadata = {**struct_meta, **spacy_meta}
+            metadata = sanitize_metadata(metadata)
+            metadatas.append(metadata)
 
-        
-        ids.append(f"chunk_{i}")
+            ids.append(f"chunk_{i}")
 
-    # Insert into DB
-    collection.add(
-        ids=ids,
-        documents=documents,
-        metadatas=metadatas
-    )
+        # Embed the whole batch in one forward pass, then insert
+        collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings.embedder(documents)
+        )
 
     print("GDPR ChromaDB build complete with semantic metadata.")
 
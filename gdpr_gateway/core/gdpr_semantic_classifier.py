@@ -1,16 +1,74 @@
+import os
+import re
+from itertools import islice
 from typing import List, Dict
-from gdpr_gateway.core.rag_classifier import semantic_gdpr_lookup
+from gdpr_gateway.core.rag_classifier import semantic_gdpr_lookup, semantic_gdpr_lookup_batch
 
 # Tune once, then lock it
 GDPR_DISTANCE_THRESHOLD = 0.30
 
+# ==========================================================
+# CHEAP PRE-FILTER
+# Embedding the prompt is the most expensive step of the pipeline, so
+# skip it for text that cannot be close to any GDPR passage: very short
+# input, or input sharing no content word with the regulation itself.
+# ==========================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(SCRIPT_DIR, "data/GDPR_regs.txt")
+
+MIN_SEMANTIC_CHARS = 30
+MAX_PREFILTER_WORDS = 64
+
+_WORD_RE = re.compile(r"[a-z]{4,}")
+
+# Function words carry no GDPR signal but appear in almost every prompt
+_STOPWORDS = frozenset({
+    "about", "after", "also", "been", "before", "being", "could", "does",
+    "each", "from", "have", "here", "into", "just", "like", "more", "most",
+    "only", "other", "same", "shall", "should", "some", "such", "than",
+    "that", "their", "them", "then", "there", "these", "they", "this",
+    "those", "under", "upon", "very", "were", "what", "when", "where",
+    "which", "while", "will", "with", "within", "without", "would", "your"
+})
+
+
+def _load_gdpr_keywords():
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        words = set(_WORD_RE.findall(f.read().lower()))
+    return frozenset(words - _STOPWORDS)
+
+
+_GDPR_KEYWORDS = _load_gdpr_keywords()
+
+
+def _worth_semantic_check(text: str) -> bool:
+    if len(text) < MIN_SEMANTIC_CHARS:
+        return False
+
+    words = islice(_WORD_RE.finditer(text.lower()), MAX_PREFILTER_WORDS)
+    return any(m.group() in _GDPR_KEYWORDS for m in words)
+
+
 def detect_gdpr_violations(text: str) -> List[Dict]:
     """
     Detect GDPR violations via vector similarity only.
     Deterministic. Fast. Auditable.
     """
-    results = semantic_gdpr_lookup(text)
+    if not _worth_semantic_check(text):
+        return []
+
+    return _violations_from(semantic_gdpr_lookup(text))
+
+
+def detect_gdpr_violations_batch(texts: List[str]) -> List[List[Dict]]:
+    """detect_gdpr_violations for many texts, with a single vector query."""
+    worth = [_worth_semantic_check(text) for text in texts]
+    results = iter(semantic_gdpr_lookup_batch([t for t, w in zip(texts, worth) if w]))
+
+    return [_violations_from(next(results)) if w else [] for w in worth]
+
 
+def _violations_from(results) -> List[Dict]:
     violations = []
 
     docs = results["documents"][0]
@@ -0,0 +1,31 @@
+import os
+
+"""Shared spaCy pipeline, loaded once per process.
+
+Both the PII classifier and the GDPR DB loader import `nlp` from here so
+the model weights are only held in memory once.
+"""
+
+# Any installed spaCy pipeline package can be swapped in, e.g. a distilled
+# or quantized NER model, as long as it emits the standard entity labels
+SPACY_MODEL = os.getenv("GDPR_SPACY_MODEL", "en_core_web_sm")
+
+# Components PII detection does not need; pass as `disable=` when only
+# entities are wanted. The loader keeps them for lemmas and sentences.
+NON_NER_PIPES = ["parser", "tagger", "attribute_ruler", "lemmatizer"]
+
+# Optional spaCy import + guarded model load so app won't crash at import time
+try:
+    import spacy
+    try:
+        # Run on GPU when CUDA + cupy are available, otherwise stay on CPU
+        spacy.prefer_gpu()
+        nlp = spacy.load(SPACY_MODEL)
+        SPACY_ENABLED = True
+    except Exception:
+        nlp = None
+        SPACY_ENABLED = False
+except Exception:
+    spacy = None
+    nlp = None
+    SPACY_ENABLED = False
@@ -1,18 +1,52 @@
+import asyncio
 import os
-import json
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 import time
 
-from gdpr_gateway.core import classifier
+import ahocorasick
+import xxhash
+from cachetools import LRUCache
+
+from gdpr_gateway.core import audit_log, classifier, spacy_worker
 from gdpr_gateway.core.gdpr_semantic_classifier import detect_gdpr_violations
 
 # ==========================================================
-# AUDIT LOG CONFIG
+# RESULT CACHE
+# Repeated prompts (retries, templated prefixes) skip detection.
+# Keyed on a 128-bit digest so large texts are not kept as keys.
+# ==========================================================
+CACHE_SIZE = int(os.getenv("GDPR_CACHE_SIZE", "10000"))
+_PROCESS_CACHE = LRUCache(maxsize=CACHE_SIZE)
+_CLASSIFY_CACHE = LRUCache(maxsize=CACHE_SIZE)
+
+
+def _cache_key(text: str) -> int:
+    return xxhash.xxh3_128_intdigest(text.encode("utf-8", "surrogatepass"))
+
+
+# ==========================================================
+# STAGE EXECUTORS
+# Regex, spaCy and embedding stages are independent and run
+# concurrently. spaCy has its own single thread in spacy_worker;
+# the embedding model gets one thread as well.
 # ==========================================================
-LOG_DIR = os.getenv("GDPR_AUDIT_DIR", "./logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-LOG_FILE = os.path.join(LOG_DIR, "audit_log.jsonl")
+REGEX_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="regex")
+EMBED_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+
+async def _timed(awaitable):
+    t0 = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - t0
+
+
+async def _run_timed(pool, fn, *args):
+    # Submitted here rather than by the caller: run_in_executor starts
+    # the job straight away, before _timed's clock would start
+    t0 = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    return result, time.perf_counter() - t0
 
 
 # ==========================================================
@@ -27,17 +61,8 @@ def mask_sensitive_text(
     """
     Inline masking of sensitive content using placeholders.
     """
-    masked = text
-
-    # --- Regex-based PII ---
-    for pii_type, matches in regex_hits.items():
-        for match in set(matches):
-            masked = masked.replace(match, f"[{pii_type.upper()}]")
-
-    # --- spaCy NER ---
-    for ent_type, entities in ner_hits.items():
-        for entity in set(entities):
-            masked = masked.replace(entity, f"[{ent_type.upper()}]")
+    # --- Regex-based PII + spaCy NER ---
+    masked = _replace_matches(text, regex_hits, ner_hits)
 
     # --- GDPR violations (prefix once) ---
     if gdpr_violations:
@@ -60,51 +85,134 @@ def mask_sensitive_text(
     return masked
 
 
+def _replace_matches(
+    text: str,
+    regex_hits: Dict[str, List[str]],
+    ner_hits: Dict[str, List[str]]
+) -> str:
+    """
+    Replace every detected string with its placeholder in one
+    Aho-Corasick pass. Overlapping spans are merged and masked with
+    the tag of the leftmost (then longest) one, so no part of either
+    detection is left in clear text.
+    """
+    automaton = ahocorasick.Automaton()
+
+    # NER first so a regex tag wins when both detected the same string
+    for hits in (ner_hits, regex_hits):
+        for pii_type, matches in hits.items():
+            tag = f"[{pii_type.upper()}]"
+            for match in matches:
+                if match:
+                    automaton.add_word(match, (len(match), tag))
+
+    if len(automaton) == 0:
+        return text
+    automaton.make_automaton()
+
+    spans = sorted(
+        ((end - length + 1, length, tag) for end, (length, tag) in automaton.iter(text)),
+        key=lambda span: (span[0], -span[1])
+    )
+
+    parts = []
+    pos = 0
+    for start, length, tag in spans:
+        if start < pos:
+            # overlaps the span being masked: extend it to the union
+            pos = max(pos, start + length)
+            continue
+        parts.append(text[pos:start])
+        parts.append(tag)
+        pos = start + length
+    parts.append(text[pos:])
+
+    return "".join(parts)
+
+
 # ==========================================================
-# MAIN PROCESSOR
+# PII CLASSIFICATION
 # ==========================================================
-def process_text(text: str) -> Dict:
-    start_total = time.perf_counter()
+async def classify_text(text: str) -> Dict:
+    """
+    Regex + NER classification, with NER batched across concurrent
+    requests by the spaCy worker.
+    """
+    key = _cache_key(text)
+    cached = _CLASSIFY_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    regex_hits, ner_hits = await asyncio.gather(
+        loop.run_in_executor(REGEX_POOL, classifier.detect_pii_regex, text),
+        spacy_worker.detect_pii_spacy(text)
+    )
 
-    # --------------------------------------------------
-    # 1. PII detection (regex + spaCy)
-    # --------------------------------------------------
-    t0 = time.perf_counter()
-    regex_hits = classifier.detect_pii_regex(text)
-    ner_hits = classifier.detect_pii_spacy(text)
-    t_pii = time.perf_counter() - t0
+    result = {
+        "regex": regex_hits,
+        "ner": ner_hits
+    }
+    _CLASSIFY_CACHE[key] = result
+    return result
 
-    # --------------------------------------------------
-    # 2. GDPR semantic detection (embedding-only)
-    # --------------------------------------------------
-    t0 = time.perf_counter()
-    gdpr_violations = detect_gdpr_violations(text)
-    t_semantic = time.perf_counter() - t0
 
-    # --------------------------------------------------
-    # 3. Blocking decision
-    # --------------------------------------------------
-    blocked = bool(regex_hits or ner_hits or gdpr_violations)
+# ==========================================================
+# MAIN PROCESSOR
+# ==========================================================
+async def process_text(text: str) -> Dict:
+    start_total = time.perf_counter()
 
-    # --------------------------------------------------
-    # 4. Masking
-    # --------------------------------------------------
-    t0 = time.perf_counter()
-    masked_text = mask_sensitive_text(
-        text=text,
-        regex_hits=regex_hits,
-        ner_hits=ner_hits,
-        gdpr_violations=gdpr_violations
-    )
-    t_masking = time.perf_counter() - t0
+    key = _cache_key(text)
+    cached = _PROCESS_CACHE.get(key)
+    cache_hit = cached is not None
+
+    if cache_hit:
+        regex_hits, ner_hits, gdpr_violations, blocked, masked_text = cached
+        t_pii = t_semantic = t_masking = 0.0
+    else:
+        # --------------------------------------------------
+        # 1. PII detection (regex + spaCy) and
+        # 2. GDPR semantic detection (embedding-only), concurrently
+        # --------------------------------------------------
+        (regex_hits, t_regex), (ner_hits, t_ner), (gdpr_violations, t_semantic) = (
+            await asyncio.gather(
+                _run_timed(REGEX_POOL, classifier.detect_pii_regex, text),
+                _timed(spacy_worker.detect_pii_spacy(text)),
+                _run_timed(EMBED_POOL, detect_gdpr_violations, text)
+            )
+        )
+        t_pii = max(t_regex, t_ner)
+
+        # --------------------------------------------------
+        # 3. Blocking decision
+        # --------------------------------------------------
+        blocked = bool(regex_hits or ner_hits or gdpr_violations)
+
+        # --------------------------------------------------
+        # 4. Masking
+        # --------------------------------------------------
+        t0 = time.perf_counter()
+        masked_text = mask_sensitive_text(
+            text=text,
+            regex_hits=regex_hits,
+            ner_hits=ner_hits,
+            gdpr_violations=gdpr_violations
+        )
+        t_masking = time.perf_counter() - t0
+
+        _PROCESS_CACHE[key] = (
+            regex_hits, ner_hits, gdpr_violations, blocked, masked_text
+        )
 
     # --------------------------------------------------
-    # 5. Audit log (BLOCKING)
+    # 5. Audit log (queued, written by the background writer)
     # --------------------------------------------------
     t0 = time.perf_counter()
     log_entry = {
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": time.time_ns(),
         "action": "blocked" if blocked else "allowed",
+        "cache_hit": cache_hit,
         "original_text": text,
         "masked_text": masked_text,
         "regex_hits": regex_hits,
@@ -117,7 +225,7 @@ def process_text(text: str) -> Dict:
             "audit_log_ms": None  # filled below
         }
     }
-    _write_audit_log(log_entry)
+    audit_log.write(log_entry)
     t_audit = time.perf_counter() - t0
     log_entry["timings"]["audit_log_ms"] = round(t_audit * 1000, 2)
 
@@ -143,14 +251,3 @@ def process_text(text: str) -> Dict:
         }
     }
 
-
-# ==========================================================
-# LOGGING
-# ==========================================================
-def _write_audit_log(entry: Dict):
-    """
-    Append-only audit logging.
-    Rotation/retention can be added here later.
-    """
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -1,25 +1,58 @@
 # rag_classifier.py
 import chromadb
+import functools
 import os
-from gdpr_gateway.core.embeddings import embedder
+import threading
+from gdpr_gateway.core.embeddings import HNSW_METADATA, cached_embedder, embedder
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_DIR = os.path.join(SCRIPT_DIR, "gdpr_db")
 
-client = chromadb.PersistentClient(path=DB_DIR)
+# Opening the client loads the HNSW graph from disk, so it happens on
+# first lookup rather than on import; each (forked) worker opens its own
+_INIT_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _open_collection():
+    client = chromadb.PersistentClient(path=DB_DIR)
+    return client.get_or_create_collection(
+        name="gdpr_chunks",
+        embedding_function=embedder,
+        metadata=HNSW_METADATA
+    )
+
+
+def _get_collection():
+    # lru_cache alone can run the loader twice under concurrent first calls
+    with _INIT_LOCK:
+        return _open_collection()
 
-collection = client.get_or_create_collection(
-    name="gdpr_chunks",
-    embedding_function=embedder
-)
 
 def semantic_gdpr_lookup(text: str, top_k: int = 5):
     """
     Pure embedding-based GDPR similarity search.
     NO LLM.
     """
-    return collection.query(
-        query_texts=[text],
+    return _get_collection().query(
+        query_embeddings=[cached_embedder.embed(text)],
         n_results=top_k,
         include=["documents", "metadatas", "distances"]
     )
+
+
+def semantic_gdpr_lookup_batch(texts, top_k: int = 5):
+    """
+    semantic_gdpr_lookup for many texts in one collection.query call.
+    Returns one result per text, in the same shape as the single lookup.
+    """
+    if not texts:
+        return []
+
+    fields = ["documents", "metadatas", "distances"]
+    results = _get_collection().query(
+        query_embeddings=cached_embedder.embed_many(texts),
+        n_results=top_k,
+        include=fields
+    )
+    return [{field: [results[field][i]] for field in fields} for i in range(len(texts))]
@@ -0,0 +1,98 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from gdpr_gateway.core import classifier
+from gdpr_gateway.core.nlp_singleton import NON_NER_PIPES, SPACY_ENABLED, nlp
+
+"""Coalesces concurrent spaCy NER requests into nlp.pipe batches.
+
+Requests are queued with a per-request Future; a single background
+worker drains the queue and runs the batch on a dedicated thread, so
+the event loop never blocks on inference.
+"""
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+BATCH_SIZE = 32
+BATCH_WAIT_S = 0.005  # how long the worker waits for a batch to fill
+
+# spaCy pipelines are not safe to share across concurrent pipe() calls
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spacy")
+
+_queue = None
+_worker_task = None
+
+
+# ==========================================================
+# WORKER LIFECYCLE
+# ==========================================================
+def start():
+    """Start the batching worker on the running event loop (idempotent)."""
+    global _queue, _worker_task
+
+    if _worker_task is not None and not _worker_task.done():
+        return
+
+    _queue = asyncio.Queue()
+    _worker_task = asyncio.get_running_loop().create_task(_worker())
+
+
+async def stop():
+    global _worker_task
+
+    if _worker_task is None:
+        return
+
+    _worker_task.cancel()
+    try:
+        await _worker_task
+    except asyncio.CancelledError:
+        pass
+    _worker_task = None
+
+
+async def _worker():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _queue.get()]
+
+        # Give concurrent requests a moment to join this batch
+        if _queue.empty():
+            await asyncio.sleep(BATCH_WAIT_S)
+        while len(batch) < BATCH_SIZE and not _queue.empty():
+            batch.append(_queue.get_nowait())
+
+        texts = [text for text, _ in batch]
+        try:
+            results = await loop.run_in_executor(_EXECUTOR, _run_pipe, texts)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+def _run_pipe(texts: List[str]) -> List[Dict[str, List[str]]]:
+    docs = nlp.pipe(texts, batch_size=BATCH_SIZE, disable=NON_NER_PIPES)
+    return [classifier.entities_from_doc(doc) for doc in docs]
+
+
+# ==========================================================
+# PUBLIC API
+# ==========================================================
+async def detect_pii_spacy(text: str) -> Dict[str, List[str]]:
+    """Async, batched equivalent of classifier.detect_pii_spacy."""
+    if not SPACY_ENABLED:
+        return {}
+
+    start()
+    fut = asyncio.get_running_loop().create_future()
+    _queue.put_nowait((text, fut))
+    return await fut
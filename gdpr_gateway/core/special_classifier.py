@@ -1,19 +1,133 @@
-import json
+import asyncio
+import logging
 import requests
+import sqlite3
+import threading
 import time
+import weakref
 import chromadb
 import os
 
+import ahocorasick
+import aiohttp
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from blake3 import blake3 as _hash
+except ImportError:
+    from hashlib import blake2b as _hash
+
 """OPTIONAL
 Must Run asynchronously
 Classifies text for GDPR special categories using Llama 3 LLM. """
 
+logger = logging.getLogger(__name__)
+
 OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llama3"
+
+# Keep the model resident between requests, and answer deterministically
+OLLAMA_KEEP_ALIVE = os.getenv("GDPR_OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_OPTIONS = {
+    "num_ctx": int(os.getenv("GDPR_OLLAMA_NUM_CTX", "2048")),
+    "temperature": 0.0
+}
+
+# The fixed answer schema, in prompt order
+_KEYS = ("health", "political", "religious", "sexual_orientation", "biometric", "genetic", "union")
+
+# One pooled keep-alive session for all synchronous Ollama calls, instead
+# of a fresh TCP connection per request. Classification is idempotent,
+# so POSTs are retried with backoff while Ollama restarts or is overloaded.
+# Read timeouts are not retried: a generation that timed out would only
+# time out again, multiplying the wait.
+_retry = Retry(
+    total=3,
+    read=0,
+    backoff_factor=0.2,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=frozenset({"POST"})
+)
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(
+    pool_connections=8, pool_maxsize=32, pool_block=False, max_retries=_retry
+))
+_session.headers.update({"Connection": "keep-alive"})
+
+# ==========================================================
+# RESULT CACHE
+# Content-addressed: the key is a hash of model + text, so a model
+# change never serves stale answers. Shared across workers via sqlite.
+# Rows older than CACHE_MAX_AGE_SECONDS are pruned on every write, which
+# bounds the file and also clears out entries of retired models.
+# ==========================================================
+CACHE_FILE = os.getenv("GDPR_SPECIAL_CACHE", "./cache/special_categories.sqlite3")
+os.makedirs(os.path.dirname(CACHE_FILE) or ".", exist_ok=True)
+CACHE_MAX_AGE_SECONDS = float(os.getenv("GDPR_SPECIAL_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+_SQLITE_MAX_VARS = 900
+
+_cache_lock = threading.Lock()
+_cache_db = sqlite3.connect(CACHE_FILE, check_same_thread=False, isolation_level=None)
+_cache_db.execute("PRAGMA journal_mode=WAL")
+_cache_db.execute(
+    "CREATE TABLE IF NOT EXISTS special_categories ("
+    "key TEXT PRIMARY KEY, detected TEXT NOT NULL, created REAL NOT NULL)"
+)
+_cache_db.execute(
+    "CREATE INDEX IF NOT EXISTS special_categories_created ON special_categories (created)"
+)
+
+
+def _cache_key(text: str) -> str:
+    return _hash(f"{OLLAMA_MODEL}\x00{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _cache_get_many(keys, ttl_seconds=None):
+    """Return {key: detected} for every cached key, in one SELECT per 900 keys."""
+    keys = list(set(keys))
+    oldest = time.time() - ttl_seconds if ttl_seconds is not None else 0
+    hits = {}
+
+    with _cache_lock:
+        for start in range(0, len(keys), _SQLITE_MAX_VARS):
+            chunk = keys[start:start + _SQLITE_MAX_VARS]
+            rows = _cache_db.execute(
+                "SELECT key, detected FROM special_categories "
+                f"WHERE created >= ? AND key IN ({','.join('?' * len(chunk))})",
+                (oldest, *chunk)
+            )
+            hits.update((key, orjson.loads(detected)) for key, detected in rows)
 
-PROMPT_TEMPLATE = """
+    return hits
+
+
+def _cache_put_many(items):
+    """Store (key, detected) pairs and drop rows past CACHE_MAX_AGE_SECONDS."""
+    now = time.time()
+    with _cache_lock:
+        _cache_db.execute(
+            "DELETE FROM special_categories WHERE created < ?",
+            (now - CACHE_MAX_AGE_SECONDS,)
+        )
+        _cache_db.executemany(
+            "INSERT OR REPLACE INTO special_categories (key, detected, created) VALUES (?, ?, ?)",
+            [(key, orjson.dumps(detected).decode(), now) for key, detected in items]
+        )
+
+
+# ==========================================================
+# PROMPTS
+# The fixed instructions go in the `system` field and only the text goes
+# in `prompt`, so Ollama can reuse the already-processed system prefix
+# from its KV cache instead of re-reading it on every request.
+# ==========================================================
+SYSTEM_PROMPT = """
 You are a GDPR compliance classifier.
 
-Your task is to determine whether the following text contains ANY GDPR special categories of personal data.
+Your task is to determine whether the text in the user message contains ANY GDPR special categories of personal data.
 
 Special categories include:
 - health data
@@ -24,12 +138,9 @@ Special categories include:
 - genetic data
 - trade union membership
 
-TEXT TO ANALYZE:
-\"\"\"{text}\"\"\"
-
 Respond in STRICT JSON format only:
 
-{{
+{
   "health": true/false,
   "political": true/false,
   "religious": true/false,
@@ -37,43 +148,397 @@ Respond in STRICT JSON format only:
   "biometric": true/false,
   "genetic": true/false,
   "union": true/false
-}}
+}
 
 Do NOT add explanations.
 Do NOT add commentary.
 ONLY return valid JSON.
 """
 
-def detect_special_categories(text: str):
-    prompt = PROMPT_TEMPLATE.format(text=text)
+# Several texts per prompt for bulk scans: amortizes the prompt overhead
+# and the per-request queuing on the Ollama server
+BATCH_SYSTEM_PROMPT = """
+You are a GDPR compliance classifier.
+
+Your task is to determine, for EACH numbered text in the user message, whether it contains ANY GDPR special categories of personal data.
+Each text is given as ROW <number>: \"\"\"<text>\"\"\"
+
+Special categories include:
+- health data
+- political opinions
+- religious or philosophical beliefs
+- sexual orientation
+- biometric data
+- genetic data
+- trade union membership
+
+Respond in STRICT JSON format only, with exactly one entry per ROW:
+
+{
+  "rows": [
+    {
+      "idx": <ROW number>,
+      "health": true/false,
+      "political": true/false,
+      "religious": true/false,
+      "sexual_orientation": true/false,
+      "biometric": true/false,
+      "genetic": true/false,
+      "union": true/false
+    }
+  ]
+}
+
+Do NOT add explanations.
+Do NOT add commentary.
+ONLY return valid JSON.
+"""
+
+
+def _build_batch_prompt(texts) -> str:
+    return "\n".join(f'ROW {idx}: """{text}"""' for idx, text in enumerate(texts))
+
+
+# ==========================================================
+# LEXICON PREFILTER
+# Most texts mention none of the special categories. Only texts that
+# contain at least one lexicon term are sent to the LLM for confirmation.
+# Terms are matched on lowercased text and must start a word, so stems
+# cover inflections ("diabet" -> "diabetic") without firing inside
+# unrelated words; terms of up to WHOLE_WORD_MAX_CHARS characters must
+# match a whole word, optionally inflected ("sikhs", "prayed", but not
+# "generate" for "gene").
+# The lexicon favours recall: a false hit only costs an LLM call.
+# data/special_category_phrases.txt lists phrases that must (+) and
+# must not (-) pass; check them with gdpr_gateway.core.testlexicon.
+# ==========================================================
+WHOLE_WORD_MAX_CHARS = 4
+
+CATEGORY_LEXICON = {
+    "health": [
+        "health", "medical", "medicat", "diagnos", "disease", "illness", "sick",
+        "sickness", "symptom", "patient", "hospital", "clinic", "doctor", "nurse",
+        "surgery", "therap", "treatment", "prescri", "pregnan", "disabilit", "allerg",
+        "injur", "cancer", "tumor", "tumour", "chemo", "diabet", "insulin", "asthma",
+        "hiv", "aids", "hepatitis", "covid", "vaccin", "infect", "blood",
+        "heart attack", "stroke", "dementia", "alzheimer", "epilep", "mental health",
+        "mental illness", "mentally", "depress", "anxiety", "bipolar", "schizo",
+        "psychiatr", "ptsd", "adhd", "autis", "addict", "rehab", "alcoholi",
+        "antidepress", "antibiotic", "painkiller", "opioid", "pharmac", "medicine",
+        "psycholog", "counselling", "suicid", "self-harm", "overdose", "eating disorder",
+        "anorexi", "bulimi", "disorder", "syndrome", "chronic", "ill", "flu",
+        "influenza", "migraine", "seizure", "arthritis", "sclerosis", "parkinson",
+        "cholesterol", "blood pressure", "hypertension", "obes", "dialysis",
+        "transplant", "deaf", "blind", "wheelchair", "crutches", "disabled",
+        "miscarr", "abortion", "ivf", "fertility", "std", "surgeon"
+    ],
+    "political": [
+        "politic", "vote", "votes", "voted", "voting", "voter", "election", "ballot",
+        "democrat", "republican", "liberal", "conservative", "labour party", "tory",
+        "tories", "socialis", "communis", "fascis", "green party", "party member",
+        "left-wing", "right-wing", "ideolog", "activis", "protest", "campaign",
+        "parliament", "congress", "senator"
+    ],
+    "religious": [
+        "relig", "faith", "belief", "spiritual", "philosoph", "god", "gods", "pray",
+        "prayer", "praying", "church", "mosque", "synagogue", "temple", "catholic",
+        "protestant", "christian", "evangelical", "orthodox", "baptis", "mormon",
+        "jehovah", "muslim", "islam", "jew", "jews", "jewish", "judaism", "hindu",
+        "buddhis", "sikh", "atheis", "agnostic", "bible", "quran", "koran", "torah",
+        "ramadan", "kosher", "halal", "worship", "jesus", "christ", "allah", "buddha",
+        "imam", "rabbi", "priest", "pastor", "vicar", "monk", "nun", "hijab", "turban",
+        "kippah", "yarmulke", "sabbath", "shabbat", "passover", "eid", "diwali",
+        "communion", "confession", "pilgrimage", "hajj", "gurdwara", "scientolog",
+        "pagan", "wicca", "attend mass", "attended mass", "attends mass",
+        "go to mass", "goes to mass", "went to mass", "sunday mass"
+    ],
+    "sexual_orientation": [
+        "sexual", "gay", "lesbian", "bisexual", "homosexual", "heterosexual",
+        "pansexual", "asexual", "queer", "lgbt", "transgender", "same-sex", "same sex",
+        "coming out", "boyfriend", "girlfriend", "husband", "wife", "wives"
+    ],
+    "biometric": [
+        "biometric", "fingerprint", "finger print", "facial", "face id", "faceid",
+        "face scan", "face recognition", "retina", "iris", "voiceprint", "voice print",
+        "palm print", "gait", "dna"
+    ],
+    "genetic": [
+        "genetic", "gene", "genes", "genom", "dna", "chromosom", "hereditar",
+        "brca", "23andme", "ancestry"
+    ],
+    "union": [
+        "union", "unionis", "unioniz", "teamster", "collective bargaining", "strike",
+        "shop steward", "afl-cio"
+    ]
+}
+
+
+def _build_lexicon_automaton():
+    automaton = ahocorasick.Automaton()
+    for terms in CATEGORY_LEXICON.values():
+        for term in terms:
+            automaton.add_word(term, (len(term), len(term) <= WHOLE_WORD_MAX_CHARS))
+    automaton.make_automaton()
+    return automaton
+
+
+_LEXICON_AUTOMATON = _build_lexicon_automaton()
+
+
+# Endings a whole-word term may still take ("sikh" -> "sikhs")
+INFLECTION_SUFFIXES = ("s", "es", "ed", "d", "ing")
+
+
+def _ends_word(text: str, pos: int) -> bool:
+    return pos >= len(text) or not text[pos].isalpha()
+
 
+def _mentions_special_category(text: str) -> bool:
+    lowered = text.lower()
+    for end, (length, whole_word) in _LEXICON_AUTOMATON.iter(lowered):
+        start = end - length + 1
+        if start > 0 and lowered[start - 1].isalpha():
+            continue
+        after = end + 1
+        if whole_word and not _ends_word(lowered, after) and not any(
+            lowered.startswith(suffix, after) and _ends_word(lowered, after + len(suffix))
+            for suffix in INFLECTION_SUFFIXES
+        ):
+            continue
+        return True
+    return False
+
+
+# Once the JSON object is closed, the rest of the stream is only drained
+# (so the connection can go back to the pool) for this many more chunks;
+# a model that keeps generating past that is hung up on instead
+MAX_TRAILING_CHUNKS = 8
+
+
+class _JSONObjectScanner:
+    """Tracks brace depth across streamed fragments, ignoring braces in strings."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, fragment: str) -> bool:
+        """Return True once the first top-level {...} object is closed."""
+        for ch in fragment:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+def _payload(system: str, prompt: str, stream: bool):
+    return {
+        "model": OLLAMA_MODEL,
+        "system": system,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": OLLAMA_OPTIONS
+    }
+
+
+def _generate(system: str, prompt: str) -> str:
     start_time = time.time()
-    response = requests.post(
+    parts = []
+    scanner = _JSONObjectScanner()
+    trailing = None
+
+    # Stream the tokens and stop collecting once the JSON object is closed.
+    # Reading to the end of the stream returns the socket to the pool;
+    # breaking off early closes it but stops a runaway generation.
+    with _session.post(
         OLLAMA_URL,
-        json={
-            "model": "llama3",
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    end_time = time.time()
-    print(f"Llama 3 response time: {end_time - start_time:.2f} seconds")
+        json=_payload(system, prompt, stream=True),
+        stream=True,
+        timeout=(3, 120)
+    ) as response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            if trailing is not None:
+                trailing += 1
+                if trailing > MAX_TRAILING_CHUNKS:
+                    break
+                continue
+
+            fragment = orjson.loads(line).get("response", "")
+            parts.append(fragment)
+            if scanner.feed(fragment):
+                trailing = 0
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Llama 3 response time: %.2f seconds", time.time() - start_time)
+
+    return "".join(parts).strip()
+
+
+def detect_special_categories(text: str, ttl_seconds=None):
+    """Cached by model + text; entries older than `ttl_seconds` are recomputed."""
+    if not _mentions_special_category(text):
+        return []
+
+    key = _cache_key(text)
+    cached = _cache_get_many([key], ttl_seconds)
+    if key in cached:
+        return cached[key]
+
+    raw = _generate(SYSTEM_PROMPT, text)
+    detected = _parse_categories(raw)
+
+    _cache_put_many([(key, detected)])
+    return detected
+
+
+def detect_special_categories_batch(texts, rows_per_prompt: int = 8, ttl_seconds=None):
+    """
+    Classify texts `rows_per_prompt` at a time, one LLM call per chunk.
+    Texts without a lexicon hit are skipped, cached texts are looked up
+    in one query, and rows the model leaves out or mangles are
+    classified individually. Results are in input order.
+    """
+    keys = [_cache_key(text) if _mentions_special_category(text) else None for text in texts]
+    results = _cache_get_many([key for key in keys if key], ttl_seconds)
+
+    misses = {key: text for key, text in zip(keys, texts) if key and key not in results}
+    pending = list(misses)
+    computed = {}
+
+    for start in range(0, len(pending), rows_per_prompt):
+        chunk = pending[start:start + rows_per_prompt]
+        prompt = _build_batch_prompt([misses[key] for key in chunk])
+        try:
+            rows = _parse_json(_generate(BATCH_SYSTEM_PROMPT, prompt)).get("rows")
+        except ValueError:
+            # Unparseable answer: every row in the chunk falls back below
+            rows = None
+        if not isinstance(rows, list):
+            rows = []
+
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            idx = row.get("idx")
+            if isinstance(idx, int) and 0 <= idx < len(chunk):
+                computed[chunk[idx]] = [k for k in _KEYS if row.get(k)]
+
+    _cache_put_many(computed.items())
+    results.update(computed)
 
-    raw = response.json().get("response", "").strip()
+    for key, text in misses.items():
+        if key not in results:
+            results[key] = detect_special_categories(text, ttl_seconds)
 
+    return [results[key] if key else [] for key in keys]
+
+
+def _parse_categories(raw: str):
+    data = _parse_json(raw)
+
+    detected = [k for k in _KEYS if data.get(k)]
+
+    return detected
+
+
+def _parse_json(raw: str):
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
         # fallback: try extracting first {...} block
         try:
             json_str = raw[raw.index("{"): raw.rindex("}") + 1]
-            data = json.loads(json_str)
-        except:
+            data = orjson.loads(json_str)
+        except ValueError:
             raise ValueError(f"Invalid JSON from Llama 3:\n{raw}")
 
-    detected = [k for k, v in data.items() if v]
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid JSON from Llama 3:\n{raw}")
 
-    return detected
+    return data
+
+
+# ==========================================================
+# ASYNC FAN-OUT
+#
+# Many texts are classified concurrently over one aiohttp session per
+# event loop. Ollama only runs them in parallel when the server is
+# started with OLLAMA_NUM_PARALLEL > 1, e.g.
+#     OLLAMA_NUM_PARALLEL=8 ollama serve
+# otherwise the requests queue server-side.
+# ==========================================================
+_sessions = weakref.WeakKeyDictionary()
+
+
+def _get_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120))
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def _ollama_generate(session: aiohttp.ClientSession, system: str, prompt: str) -> str:
+    async with session.post(OLLAMA_URL, json=_payload(system, prompt, stream=False)) as response:
+        data = orjson.loads(await response.read())
+    return data.get("response", "").strip()
+
+
+async def _classify_async(text: str):
+    raw = await _ollama_generate(_get_session(), SYSTEM_PROMPT, text)
+    return _parse_categories(raw)
+
+
+async def detect_special_categories_async(text: str, ttl_seconds=None):
+    return (await detect_special_categories_many([text], ttl_seconds=ttl_seconds))[0]
+
+
+async def detect_special_categories_many(texts, concurrency: int = 8, ttl_seconds=None):
+    """
+    Classify many texts concurrently; results are in input order.
+    Texts without a lexicon hit are skipped, cached texts are looked up
+    in one query and only misses reach the LLM.
+    """
+    keys = [_cache_key(text) if _mentions_special_category(text) else None for text in texts]
+    results = _cache_get_many([key for key in keys if key], ttl_seconds)
+
+    misses = {key: text for key, text in zip(keys, texts) if key and key not in results}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify(text):
+        async with semaphore:
+            return await _classify_async(text)
+
+    computed = await asyncio.gather(*(classify(text) for text in misses.values()))
+    _cache_put_many(zip(misses, computed))
+    results.update(zip(misses, computed))
+
+    return [results[key] if key else [] for key in keys]
 
 def create_vector_store():
     vector_store_path  = "chroma_db"
@@ -0,0 +1,14 @@
+import os
+from gdpr_gateway.core.special_classifier import _mentions_special_category
+
+path = os.path.join(os.path.dirname(__file__), "data", "special_category_phrases.txt")
+failures = 0
+with open(path, encoding="utf-8") as f:
+    for line in f:
+        if not line.startswith(("+ ", "- ")):
+            continue
+        expected, phrase = line[0] == "+", line[2:].strip()
+        if _mentions_special_category(phrase) != expected:
+            failures += 1
+            print(("missed: " if expected else "false hit: ") + phrase)
+print(f"{failures} failures")